@@ -7,14 +7,25 @@
 """
 
 import os
+import posixpath
 import shutil
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from functools import lru_cache, partial, wraps
 import pandas as pd
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, session, abort
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
+from app_utils import EXCEL_ENGINE, INVALID_NAME_RE, RESERVED_NAMES
+from copy_utils import COPY_MODES, fast_copy, make_dirs_once, run_copy_jobs
+
 # ==================== 初始化 ====================
 app = Flask(__name__, static_folder='static', template_folder='templates')
+app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
 CORS(app)
 
 # 配置
@@ -34,26 +45,143 @@ ALLOWED_EXTENSIONS = {
     '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff'
 }
 
-# 全局变量
-selected_files = []     # [{"name": "", "path": ""}]
-name_list = []          # 名称列表
-excel_data = []         # Excel 数据 [[], []]
-folder_levels = []      # ["A", "B"]
-data_source = 'name'    # 'name' 或 'excel'
-output_folder = OUTPUT_FOLDER
+# 任务状态：每个浏览器会话一份（按 session 中的 job_id 区分），多线程服务下各请求互不覆盖
+MAX_JOBS = 64           # 最多保留的任务数，超出后淘汰最久未使用的任务及其临时文件
+_jobs = OrderedDict()   # {job_id: 任务状态}
+_jobs_lock = threading.Lock()
 
 # ==================== 工具函数 ====================
 def allowed_file(filename):
     return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
+# 仅支持单个字母的列名，无效时返回 -1
 def column_to_index(column):
+    if not isinstance(column, str) or len(column) != 1:
+        return -1
+    return ord(column.upper()) - ord('A')
+
+# 线程池任务：复制单个文件并校验，返回 (成功数, 失败数, 失败信息)；大小取自上传时记录的 size_bytes
+def _copy_checked(src_cache, file_info, dst, copy_mode, copy=fast_copy):
     try:
-        return ord(column.upper()) - ord('A')
+        if file_info["size_bytes"] > 10 * 1024 * 1024:
+            return 0, 1, f"文件过大：{file_info['name']}"
+        copy(src_cache, file_info["path"], dst, copy_mode)
+        return 1, 0, None
+    except FileNotFoundError:
+        return 0, 1, f"源文件不存在：{file_info['name']}"
+    except Exception as e:
+        return 0, 1, f"复制失败：{str(e)}"
+
+# 线程池任务：复制单个文件，源文件不存在时直接跳过
+def _copy_lenient(src_cache, file_info, dst, copy_mode, copy=fast_copy):
+    try:
+        copy(src_cache, file_info["path"], dst, copy_mode)
+        return 1, 0, None
+    except FileNotFoundError:
+        return 0, 0, None
     except:
-        return -1
+        return 0, 1, None
+
+# 输出方式：folder 在输出目录中逐个生成文件夹与文件（默认）；zip 打包为一个 ZIP，只需下载一次
+OUTPUT_MODES = ('folder', 'zip')
+ZIP_NAME = 'result.zip'
+# 本身已是压缩格式的文件直接存储，避免重复 deflate 浪费 CPU
+_ZIP_STORED_EXTENSIONS = {'.docx', '.xlsx', '.pptx', '.ods', '.jpg', '.jpeg', '.png', '.gif'}
+
+# 把 (file_info, 包内路径) 任务写入同一个 ZIP，每个源文件只读取一次；失败计数规则与 copy_one 相同
+def run_zip_jobs(copy_one, copy_jobs, zip_path, result):
+    src_cache = {}  # {源路径: (文件内容, 修改时间)}
+    written = set()  # 已写入的包内路径；重复行在文件夹模式下是覆盖同一文件，这里同样只保留一份
+
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        def write_entry(src_cache, src_path, arcname, copy_mode):
+            if arcname in written:
+                return
+            cached = src_cache.get(src_path)
+            if cached is None:
+                with open(src_path, 'rb') as fsrc:
+                    src_stat = os.fstat(fsrc.fileno())
+                    data = fsrc.read()
+                # ZIP 时间戳不能早于 1980 年
+                date_time = time.localtime(max(src_stat.st_mtime, 315532800))[:6]
+                cached = src_cache[src_path] = (data, date_time)
+            data, date_time = cached
+            info = zipfile.ZipInfo(arcname, date_time)
+            info.compress_type = (zipfile.ZIP_STORED if os.path.splitext(arcname)[1].lower() in _ZIP_STORED_EXTENSIONS
+                                  else zipfile.ZIP_DEFLATED)
+            info.external_attr = 0o644 << 16
+            zf.writestr(info, data)
+            written.add(arcname)
+
+        for file_info, arcname in copy_jobs:
+            success, fail, detail = copy_one(src_cache, file_info, arcname, None, write_entry)
+            result["success_count"] += success
+            result["fail_count"] += fail
+            if detail:
+                result["fail_details"].append(detail)
+
+# 新建任务状态，上传与输出目录按 job_id 隔离
+def _new_job_state(job_id):
+    return {
+        "selected_files": [],   # [{"name": "", "path": "", "size_bytes": 0}]
+        "name_list": [],        # 名称列表
+        "excel_df": None,       # 上传的 Excel 表（DataFrame），处理时只取层级列
+        "folder_levels": [],    # ["A", "B"]
+        "data_source": 'name',  # 'name' 或 'excel'
+        "upload_folder": os.path.join(app.config['UPLOAD_FOLDER'], job_id),
+        "output_folder": os.path.join(OUTPUT_FOLDER, job_id),
+        "in_use": 0,            # 正在上传/处理的请求数，大于 0 时不会被淘汰
+    }
+
+# 获取当前会话的任务状态，不存在（或已被淘汰）时新建；claim=True 时同时标记为使用中（见 job_in_use）
+def get_job_state(claim=False):
+    job_id = session.get('job_id')
+    evicted = []
+    with _jobs_lock:
+        state = _jobs.get(job_id) if job_id else None
+        if state is None:
+            job_id = uuid.uuid4().hex
+            session['job_id'] = job_id
+            state = _jobs[job_id] = _new_job_state(job_id)
+            # 从最久未使用的任务开始淘汰，跳过正在上传/处理的任务
+            for old_id in list(_jobs):
+                if len(_jobs) <= MAX_JOBS:
+                    break
+                if old_id != job_id and _jobs[old_id]["in_use"] == 0:
+                    evicted.append(_jobs.pop(old_id))
+        else:
+            _jobs.move_to_end(job_id)
+        if claim:
+            state["in_use"] += 1
+    for old_state in evicted:
+        shutil.rmtree(old_state["upload_folder"], ignore_errors=True)
+        shutil.rmtree(old_state["output_folder"], ignore_errors=True)
+    return state
+
+# 只查找当前会话已有的任务状态，不存在时返回 None（不新建任务）
+def find_job_state():
+    job_id = session.get('job_id')
+    with _jobs_lock:
+        state = _jobs.get(job_id) if job_id else None
+        if state is not None:
+            _jobs.move_to_end(job_id)
+    return state
+
+# 路由装饰器：上传/处理期间占用当前任务，期间该任务及其临时目录不会被淘汰删除
+def job_in_use(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        state = get_job_state(claim=True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            with _jobs_lock:
+                state["in_use"] -= 1
+    return wrapper
 
 # ==================== 核心处理函数（完整保留您的逻辑） ====================
-def process_generation(selected_files, name_list, excel_data, folder_levels, data_source, output_dir):
+def process_generation(selected_files, name_list, excel_df, folder_levels, data_source, output_dir,
+                       copy_mode='copy', output_mode='folder'):
     result = {
         "success_count": 0,
         "fail_count": 0,
@@ -66,55 +194,43 @@ def process_generation(selected_files, name_list, excel_data, folder_levels, dat
         result["fail_details"].append("没有有效的文件夹层级设置")
         return result
 
+    # 先计算每个名称/行对应的目标文件夹，再统一去重建目录，最后交给线程池并发复制
+    row_targets = []  # [(序号, 目标文件夹路径)]
+    row_error = "处理第 {} 个名称失败：{}"
+    copy_one = _copy_checked
     if data_source == 'name':
         if not name_list:
             result["fail_details"].append("未获取到名称列表数据")
             return result
 
+        # 清理结果按原文本缓存，相同的名称/层级文本只清理一次；非字符串的值在所在行报错，不影响其他行
+        clean = lru_cache(maxsize=None)(partial(INVALID_NAME_RE.sub, ''))
+
         for name_idx, name in enumerate(name_list):
             try:
                 folder_parts = []
                 for level_idx, level in enumerate(valid_levels):
-                    folder_name = name if level_idx == 0 else level if not level.isalpha() else name
-                    clean_name = ''.join(c for c in folder_name if c not in '/\\:*?"<>|')
-                    if not clean_name:
-                        clean_name = f"文件夹_{name_idx}_{level_idx}"
-                    folder_parts.append(clean_name)
-                
-                full_path = os.path.join(output_dir, *folder_parts)
-                os.makedirs(full_path, exist_ok=True)
-                result["folder_count"] += 1
+                    folder_name = clean(name if level_idx == 0 or level.isalpha() else level)
+                    if folder_name in RESERVED_NAMES:
+                        folder_name = f"文件夹_{name_idx}_{level_idx}"
+                    folder_parts.append(folder_name)
                 
-                for file_info in selected_files:
-                    try:
-                        src = file_info["path"]
-                        if not os.path.exists(src):
-                            result["fail_details"].append(f"源文件不存在：{file_info['name']}")
-                            result["fail_count"] += 1
-                            continue
-                        if os.path.getsize(src) > 10 * 1024 * 1024:
-                            result["fail_details"].append(f"文件过大：{file_info['name']}")
-                            result["fail_count"] += 1
-                            continue
-                        dst = os.path.join(full_path, file_info["name"])
-                        shutil.copy2(src, dst)
-                        result["success_count"] += 1
-                    except Exception as e:
-                        result["fail_details"].append(f"复制失败：{str(e)}")
-                        result["fail_count"] += 1
+                row_targets.append((name_idx, os.path.join(output_dir, *folder_parts)))
             except Exception as e:
-                result["fail_details"].append(f"处理第 {name_idx+1} 个名称失败：{str(e)}")
+                result["fail_details"].append(row_error.format(name_idx + 1, str(e)))
                 result["fail_count"] += len(selected_files)
 
     elif data_source == 'excel':
-        if not excel_data:
+        if excel_df is None or excel_df.empty:
             result["fail_details"].append("未获取到Excel数据")
             return result
+        row_error = None
+        copy_one = _copy_lenient
 
         excel_level_indices = []
         for level in valid_levels:
             idx = column_to_index(level)
-            if 0 <= idx < len(excel_data[0]) if excel_data else False:
+            if 0 <= idx < len(excel_df.columns):
                 excel_level_indices.append(idx)
             else:
                 result["fail_details"].append(f"无效列：{level}")
@@ -123,32 +239,55 @@ def process_generation(selected_files, name_list, excel_data, folder_levels, dat
             result["fail_details"].append("没有有效的Excel列")
             return result
 
-        for row_idx, row in enumerate(excel_data):
+        # 直接在上传的表上只取层级列，整列向量化清理非法字符
+        cleaned_rows = (excel_df.iloc[:, excel_level_indices]
+                        .apply(lambda col: col.map(str).str.replace(INVALID_NAME_RE, '', regex=True))
+                        .to_numpy().tolist())
+
+        for row_idx, clean_row in enumerate(cleaned_rows):
             try:
                 folder_parts = []
-                for idx in excel_level_indices:
-                    cell = row[idx] if idx < len(row) else ""
-                    clean_name = ''.join(c for c in str(cell) if c not in '/\\:*?"<>|')
-                    if not clean_name:
+                for idx, clean_name in zip(excel_level_indices, clean_row):
+                    if clean_name in RESERVED_NAMES:
                         clean_name = f"文件夹_{row_idx}_{idx}"
                     folder_parts.append(clean_name)
                 
-                full_path = os.path.join(output_dir, *folder_parts)
-                os.makedirs(full_path, exist_ok=True)
-                result["folder_count"] += 1
-                
-                for file_info in selected_files:
-                    try:
-                        src = file_info["path"]
-                        if not os.path.exists(src): continue
-                        dst = os.path.join(full_path, file_info["name"])
-                        shutil.copy2(src, dst)
-                        result["success_count"] += 1
-                    except:
-                        result["fail_count"] += 1
+                row_targets.append((row_idx, os.path.join(output_dir, *folder_parts)))
             except Exception as e:
                 result["fail_count"] += len(selected_files)
 
+    if output_mode == 'zip':
+        # 不在磁盘上建目录，包内路径相对输出目录
+        os.makedirs(output_dir, exist_ok=True)
+        copy_jobs = []
+        for row_idx, full_path in row_targets:
+            # 包内路径统一规范化，绝对路径或以 .. 开头（会跳出解压目录）的一律拒绝
+            arc_folder = posixpath.normpath(os.path.relpath(full_path, output_dir).replace(os.sep, '/'))
+            if posixpath.isabs(arc_folder) or arc_folder == '..' or arc_folder.startswith('../'):
+                if row_error:
+                    result["fail_details"].append(row_error.format(row_idx + 1, f"无效的文件夹路径：{arc_folder}"))
+                result["fail_count"] += len(selected_files)
+                continue
+            result["folder_count"] += 1
+            for file_info in selected_files:
+                copy_jobs.append((file_info, f"{arc_folder}/{file_info['name']}"))
+        run_zip_jobs(copy_one, copy_jobs, os.path.join(output_dir, ZIP_NAME), result)
+        result["zip_file"] = ZIP_NAME
+        return result
+
+    dir_errors = make_dirs_once(path for _, path in row_targets)
+    copy_jobs = []
+    for row_idx, full_path in row_targets:
+        if full_path in dir_errors:
+            if row_error:
+                result["fail_details"].append(row_error.format(row_idx + 1, str(dir_errors[full_path])))
+            result["fail_count"] += len(selected_files)
+            continue
+        result["folder_count"] += 1
+        for file_info in selected_files:
+            copy_jobs.append((file_info, os.path.join(full_path, file_info["name"])))
+
+    run_copy_jobs(copy_one, copy_jobs, result, copy_mode)
     return result
 
 # ==================== 路由 ====================
@@ -163,51 +302,64 @@ def static_files(filename):
 
 # 上传源文件
 @app.route('/upload-source-files', methods=['POST'])
+@job_in_use
 def upload_source_files():
-    global selected_files
+    state = get_job_state()
+    os.makedirs(state["upload_folder"], exist_ok=True)
     selected_files = []
     files = request.files.getlist('files')
     for file in files:
         if file and file.filename and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            path = os.path.join(state["upload_folder"], filename)
             file.save(path)
-            size_mb = os.path.getsize(path) / (1024 * 1024)
-            selected_files.append({"name": filename, "path": path, "size": f"{size_mb:.2f} MB"})
+            size = os.path.getsize(path)
+            selected_files.append({"name": filename, "path": path, "size": f"{size / (1024 * 1024):.2f} MB",
+                                   "size_bytes": size})
+    state["selected_files"] = selected_files
     return jsonify({"status": "success", "files": selected_files})
 
 # 上传 name.txt
 @app.route('/upload-name-file', methods=['POST'])
+@job_in_use
 def upload_name_file():
-    global name_list
+    state = get_job_state()
     file = request.files.get('file', None)
     if file and file.filename.endswith('.txt'):
-        path = os.path.join(app.config['UPLOAD_FOLDER'], 'name.txt')
+        os.makedirs(state["upload_folder"], exist_ok=True)
+        path = os.path.join(state["upload_folder"], 'name.txt')
         file.save(path)
         with open(path, 'r', encoding='utf-8', errors='replace') as f:
             name_list = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        state["name_list"] = name_list
         return jsonify({"status": "success", "count": len(name_list), "names": name_list[:10]})
     return jsonify({"status": "error", "message": "无效文件"})
 
 # 上传 Excel
 @app.route('/upload-excel-file', methods=['POST'])
+@job_in_use
 def upload_excel_file():
-    global excel_data
+    state = get_job_state()
     file = request.files.get('file', None)
     if file and file.filename.endswith(('.xlsx', '.xls')):
-        path = os.path.join(app.config['UPLOAD_FOLDER'], 'data.xlsx')
+        os.makedirs(state["upload_folder"], exist_ok=True)
+        path = os.path.join(state["upload_folder"], 'data.xlsx')
         file.save(path)
         try:
-            df = pd.read_excel(path, engine='openpyxl')
+            df = pd.read_excel(path, engine=EXCEL_ENGINE)
             columns = [chr(65 + i) for i in range(len(df.columns))]
-            excel_data = [row.tolist() for _, row in df.iterrows()]
-            preview = [row[:10] for row in excel_data[:10]]  # 前10行
-            return jsonify({
+            # 只转换预览部分（前10行、前10列）；空值转为 ""，NaN/NaT 无法写入 JSON
+            # （先转 object：日期列上 fillna("") 不会替换 NaT）
+            preview = df.iloc[:10, :10].astype(object).fillna("").astype(str).to_numpy().tolist()
+            response = jsonify({
                 "status": "success",
-                "rowCount": len(excel_data),
+                "rowCount": len(df),
                 "columns": columns,
                 "data": preview
             })
+            # 响应构建成功后才保存，整表保留为 DataFrame，处理时只取层级列
+            state["excel_df"] = df
+            return response
         except Exception as e:
             return jsonify({"status": "error", "message": str(e)})
     return jsonify({"status": "error", "message": "无效文件"})
@@ -215,31 +367,46 @@ def upload_excel_file():
 # 设置层级
 @app.route('/set-folder-levels', methods=['POST'])
 def set_folder_levels():
-    global folder_levels, data_source
+    state = get_job_state()
     data = request.json
-    folder_levels = data.get('levels', [])
-    data_source = data.get('dataSource', 'name')
+    state["folder_levels"] = data.get('levels', [])
+    state["data_source"] = data.get('dataSource', 'name')
     return jsonify({"status": "success"})
 
 # 开始处理
 @app.route('/process', methods=['POST'])
+@job_in_use
 def process():
-    global selected_files, name_list, excel_data, folder_levels, data_source, output_folder
+    state = get_job_state()
+    options = request.get_json(silent=True) or {}
+    copy_mode = options.get('copyMode', 'copy')
+    if copy_mode not in COPY_MODES:
+        return jsonify({"status": "error", "message": f"无效的复制方式：{copy_mode}"})
+    output_mode = options.get('outputMode', 'folder')
+    if output_mode not in OUTPUT_MODES:
+        return jsonify({"status": "error", "message": f"无效的输出方式：{output_mode}"})
     result = process_generation(
-        selected_files, name_list, excel_data,
-        folder_levels, data_source, output_folder
+        state["selected_files"], state["name_list"],
+        state["excel_df"] if state["data_source"] == 'excel' else None,
+        state["folder_levels"], state["data_source"], state["output_folder"], copy_mode, output_mode
     )
-    return jsonify({
+    response = {
         "status": "completed",
         "result": result,
-        "output_folder": output_folder,
-        "file_count": len(selected_files)
-    })
+        "output_folder": state["output_folder"],
+        "file_count": len(state["selected_files"])
+    }
+    if "zip_file" in result:
+        response["download_url"] = f"/download/{result['zip_file']}"
+    return jsonify(response)
 
 # 下载输出（可选）
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    return send_from_directory(output_folder, filename)
+    state = find_job_state()
+    if state is None:
+        abort(404)
+    return send_from_directory(state["output_folder"], filename)
 
 # ==================== Vercel 入口 ====================
 if __name__ == '__main__':
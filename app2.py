@@ -5,25 +5,34 @@
 """
 
 import os
-import shutil
 import platform
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import filedialog
+import openpyxl
 import pandas as pd
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
 
+from app_utils import EXCEL_ENGINE, INVALID_NAME_RE, RESERVED_NAMES
+from copy_utils import COPY_MODES, fast_copy, make_dirs_once, run_copy_jobs
+
+# 当前操作系统（进程内不变，启动时取一次）
+_OS = platform.system()
+
 # 初始化Flask应用
 app = Flask(__name__)
 CORS(app)  # 解决跨域问题
 
 # 全局变量存储临时数据
-selected_files = []  # 选中的文件路径列表
+selected_files = []  # 选中的文件列表 [{"name", "path", "size_bytes"}]
 name_list = []       # name列表（手动输入或从txt读取）
 excel_data = []      # Excel数据（修复：确保正确存储）
 folder_levels = []   # 文件夹层级设置
 data_source = 'name' # 数据来源：name/excel
 source_folder = ""   # 源文件夹路径
+source_file_sizes = {}  # 源文件夹中文件的大小缓存 {路径: 字节数}
 output_folder = ""   # 输出文件夹路径
 
 # 支持的文件类型（扩展名）
@@ -34,34 +43,61 @@ SUPPORTED_EXTENSIONS = {
     '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff'
 }
 
+@lru_cache(maxsize=1)
 def get_default_output_folder():
-    """获取默认输出文件夹（桌面）"""
-    if platform.system() == 'Windows':
+    """获取默认输出文件夹（桌面，结果缓存）"""
+    if _OS == 'Windows':
         return os.path.join(os.environ['USERPROFILE'], 'Desktop')
-    elif platform.system() == 'Darwin':  # macOS
+    elif _OS == 'Darwin':  # macOS
         return os.path.join(os.environ['HOME'], 'Desktop')
     else:  # Linux
         return os.path.join(os.environ['HOME'], 'Desktop')
 
-def select_folder_dialog():
+# 隐藏的 Tk 根窗口只创建一次并复用；Tk 对象只能在创建它的线程中使用，
+# 因此所有对话框都交给同一个单线程执行器串行运行
+_TK_ROOT = None
+_TK_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tk-dialog')
+
+def _get_tk_root():
+    """获取（首次调用时创建）隐藏的 Tk 根窗口，仅在对话框线程中调用"""
+    global _TK_ROOT
+    if _TK_ROOT is None:
+        _TK_ROOT = tk.Tk()
+        _TK_ROOT.withdraw()
+        _TK_ROOT.attributes('-topmost', True)
+    return _TK_ROOT
+
+def _run_dialog(dialog, **options):
+    """在对话框线程中以复用的根窗口为父窗口弹出对话框，返回选择结果"""
+    def show():
+        root = _get_tk_root()
+        result = dialog(parent=root, **options)
+        root.update()  # 处理对话框关闭后遗留的事件，避免下次弹出时卡顿
+        return result
+    return _TK_EXECUTOR.submit(show).result()
+
+def _close_tk_root():
+    """在创建根窗口的对话框线程中销毁它并关闭该线程，避免退出时在主线程回收 Tcl 解释器"""
+    def destroy():
+        global _TK_ROOT
+        if _TK_ROOT is not None:
+            _TK_ROOT.destroy()
+            _TK_ROOT = None
+    _TK_EXECUTOR.submit(destroy).result()
+    _TK_EXECUTOR.shutdown(wait=True)
+
+def select_folder_dialog(title="选择文件夹"):
     """打开文件夹选择对话框"""
-    root = tk.Tk()
-    root.withdraw()
-    root.attributes('-topmost', True)
-    folder_path = filedialog.askdirectory(title="选择文件夹")
-    root.destroy()
+    folder_path = _run_dialog(filedialog.askdirectory, title=title)
     return folder_path if folder_path else ""
 
 def select_file_dialog(filetypes):
     """打开文件选择对话框"""
-    root = tk.Tk()
-    root.withdraw()
-    root.attributes('-topmost', True)
-    file_path = filedialog.askopenfilename(
+    file_path = _run_dialog(
+        filedialog.askopenfilename,
         title="选择文件",
         filetypes=filetypes
     )
-    root.destroy()
     return file_path if file_path else ""
 
 def get_files_in_folder(folder_path):
@@ -70,17 +106,21 @@ def get_files_in_folder(folder_path):
         return []
     
     files = []
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        if os.path.isfile(file_path):
-            ext = os.path.splitext(filename)[1].lower()
+    # scandir 的目录项自带类型信息并缓存 stat 结果，避免逐个文件重复 stat
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            ext = os.path.splitext(entry.name)[1].lower()
             if ext in SUPPORTED_EXTENSIONS:
-                file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
+                file_size = entry.stat().st_size
+                file_size_mb = file_size / (1024 * 1024)
                 if file_size_mb <= 10:
                     files.append({
-                        "name": filename,
-                        "path": file_path,
-                        "size": f"{file_size_mb:.2f} MB"
+                        "name": entry.name,
+                        "path": entry.path,
+                        "size": f"{file_size_mb:.2f} MB",
+                        "size_bytes": file_size
                     })
     return sorted(files, key=lambda x: x["name"])
 
@@ -101,27 +141,49 @@ def read_name_file(file_path):
         print(f"读取name.txt错误：{str(e)}")
         return []
 
+def _excel_cell_to_str(value):
+    """单元格值转字符串（与 pandas dtype=str 读取结果一致：空值为 ""，整数值浮点数去掉 .0）"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _read_excel_rows_openpyxl(file_path):
+    """openpyxl 只读模式逐行流式读取（首行为表头），不构建 DataFrame，返回 (列数, 数据行)"""
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = []
+        for row in wb.active.iter_rows(values_only=True):
+            row = list(row)
+            while row and row[-1] is None:
+                row.pop()
+            rows.append(row)
+    finally:
+        wb.close()
+
+    # 与 pandas 一致：丢弃末尾空行，按最宽的一行补齐列
+    while rows and not rows[-1]:
+        rows.pop()
+    column_count = max((len(row) for row in rows), default=0)
+    data = [[_excel_cell_to_str(v) for v in row] + [""] * (column_count - len(row)) for row in rows[1:]]
+    return column_count, data
+
 def read_excel_file(file_path):
     """读取Excel文件并返回数据（修复：确保正确解析）"""
     try:
-        # 修复：明确指定引擎，确保兼容性
-        df = pd.read_excel(file_path, engine='openpyxl')
+        if EXCEL_ENGINE == 'calamine':
+            # 读取时直接按字符串解析且不识别空值，单元格到手即为 str，空白为 ""
+            df = pd.read_excel(file_path, engine=EXCEL_ENGINE, dtype=str,
+                               na_filter=False, keep_default_na=False)
+            column_count = len(df.columns)
+            # 转换数据为列表（整表向量化去首尾空白；返回值全部为字符串，不含数值类型）
+            data = df.apply(lambda col: col.str.strip()).to_numpy().tolist()
+        else:
+            column_count, data = _read_excel_rows_openpyxl(file_path)
         
         # 获取列名（A, B, C, ...）
-        columns = []
-        for i in range(len(df.columns)):
-            columns.append(chr(65 + i))
-        
-        # 转换数据为列表（修复：确保正确处理空值）
-        data = []
-        for _, row in df.iterrows():
-            row_data = []
-            for cell in row:
-                if pd.isna(cell):
-                    row_data.append("")
-                else:
-                    row_data.append(str(cell).strip())
-            data.append(row_data)
+        columns = [chr(65 + i) for i in range(column_count)]
         
         return {
             "columns": columns,
@@ -133,14 +195,28 @@ def read_excel_file(file_path):
         return None
 
 def column_to_index(column):
-    """将列名转换为索引"""
-    try:
-        return ord(column.upper()) - ord('A')
-    except:
+    """将列名转换为索引（仅支持单个字母的列名，无效时返回 -1）"""
+    if not isinstance(column, str) or len(column) != 1:
         return -1
+    return ord(column.upper()) - ord('A')
 
-def process_generation(selected_files, name_list, excel_data, folder_levels, data_source, output_dir):
-    """核心处理函数"""
+def _copy_one(src_cache, file_info, dest_path, copy_mode):
+    """复制单个文件（线程池任务），返回 (成功数, 失败数, 失败信息)；大小取自选择文件时的缓存，不再重复 stat"""
+    try:
+        file_size_mb = file_info["size_bytes"] / (1024 * 1024)
+        if file_size_mb > 10:
+            return 0, 1, f"文件过大（{file_size_mb:.2f} MB）：{file_info['name']}"
+
+        fast_copy(src_cache, file_info["path"], dest_path, copy_mode)
+        return 1, 0, None
+    except FileNotFoundError:
+        return 0, 1, f"源文件不存在：{file_info['name']}"
+    except Exception as e:
+        return 0, 1, f"复制文件失败：{str(e)}"
+
+def process_generation(selected_files, name_list, excel_data, folder_levels, data_source, output_dir,
+                       copy_mode='copy'):
+    """核心处理函数（copy_mode：copy 复制 / hardlink 硬链接 / reflink 写时复制克隆）"""
     result = {
         "success_count": 0,
         "fail_count": 0,
@@ -157,56 +233,29 @@ def process_generation(selected_files, name_list, excel_data, folder_levels, dat
         result["fail_details"].append("没有有效的文件夹层级设置，无法创建文件夹")
         return result
 
+    # 先计算每个名称/行对应的目标文件夹，再统一去重建目录，最后线程池并发复制
+    row_targets = []  # [(序号, 目标文件夹路径)]
+
     # 处理name数据来源
     if data_source == 'name':
         if not name_list:
             result["fail_details"].append("未获取到名称列表数据")
             return result
 
+        # 清理结果按原文本缓存，相同的名称/层级文本只清理一次；非字符串的值在所在行报错，不影响其他行
+        clean = lru_cache(maxsize=None)(partial(INVALID_NAME_RE.sub, ''))
+
         for name_idx, name in enumerate(name_list):
             try:
                 folder_parts = []
                 for level_idx, level in enumerate(valid_levels):
-                    if level_idx == 0:
-                        folder_name = name
-                    else:
-                        folder_name = level if not level.isalpha() else name
-                    
-                    # 清理文件夹名称
-                    invalid_chars = '/\\:*?"<>|'
-                    clean_name = ''.join([c for c in folder_name if c not in invalid_chars])
-                    if not clean_name:
-                        clean_name = f"文件夹_{name_idx}_{level_idx}"
-                    folder_parts.append(clean_name)
-                
-                full_folder_path = os.path.join(output_dir, *folder_parts)
-                os.makedirs(full_folder_path, exist_ok=True)
-                result["folder_count"] += 1
+                    # 第一层及纯字母层级用名称本身，其余层级用层级文本
+                    folder_name = clean(name if level_idx == 0 or level.isalpha() else level)
+                    if folder_name in RESERVED_NAMES:
+                        folder_name = f"文件夹_{name_idx}_{level_idx}"
+                    folder_parts.append(folder_name)
                 
-                # 复制文件
-                for file_path in selected_files:
-                    try:
-                        if not os.path.exists(file_path):
-                            error_msg = f"源文件不存在：{os.path.basename(file_path)}"
-                            result["fail_details"].append(error_msg)
-                            result["fail_count"] += 1
-                            continue
-
-                        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-                        if file_size_mb > 10:
-                            error_msg = f"文件过大（{file_size_mb:.2f} MB）：{os.path.basename(file_path)}"
-                            result["fail_details"].append(error_msg)
-                            result["fail_count"] += 1
-                            continue
-
-                        dest_path = os.path.join(full_folder_path, os.path.basename(file_path))
-                        shutil.copy2(file_path, dest_path)
-                        result["success_count"] += 1
-
-                    except Exception as e:
-                        error_msg = f"复制文件失败：{str(e)}"
-                        result["fail_details"].append(error_msg)
-                        result["fail_count"] += 1
+                row_targets.append((name_idx, os.path.join(output_dir, *folder_parts)))
 
             except Exception as e:
                 error_msg = f"处理第 {name_idx+1} 个名称失败：{str(e)}"
@@ -232,52 +281,46 @@ def process_generation(selected_files, name_list, excel_data, folder_levels, dat
             result["fail_details"].append("没有有效的Excel列设置，无法创建文件夹")
             return result
 
+        # 只取层级列建表（行长度不足的单元格记为“未知_列号”），再整列向量化清理非法字符
+        level_df = pd.DataFrame([[row[idx] if idx < len(row) else f"未知_{idx}" for idx in excel_level_indices]
+                                 for row in excel_data], dtype=object)
+        cleaned_rows = (level_df
+                        .apply(lambda col: col.map(str).str.replace(INVALID_NAME_RE, '', regex=True))
+                        .to_numpy().tolist())
+
         # 处理每一行数据
-        for row_idx, row_data in enumerate(excel_data):
+        for row_idx, clean_row in enumerate(cleaned_rows):
             try:
                 folder_parts = []
-                for level_idx in excel_level_indices:
-                    folder_name = row_data[level_idx] if level_idx < len(row_data) else f"未知_{level_idx}"
-                    invalid_chars = '/\\:*?"<>|'
-                    clean_name = ''.join([c for c in folder_name if c not in invalid_chars])
-                    if not clean_name:
+                for level_idx, clean_name in zip(excel_level_indices, clean_row):
+                    if clean_name in RESERVED_NAMES:
                         clean_name = f"文件夹_{row_idx}_{level_idx}"
                     folder_parts.append(clean_name)
                 
-                full_folder_path = os.path.join(output_dir, *folder_parts)
-                os.makedirs(full_folder_path, exist_ok=True)
-                result["folder_count"] += 1
-                
-                # 复制文件
-                for file_path in selected_files:
-                    try:
-                        if not os.path.exists(file_path):
-                            error_msg = f"源文件不存在：{os.path.basename(file_path)}"
-                            result["fail_details"].append(error_msg)
-                            result["fail_count"] += 1
-                            continue
-
-                        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-                        if file_size_mb > 10:
-                            error_msg = f"文件过大（{file_size_mb:.2f} MB）：{os.path.basename(file_path)}"
-                            result["fail_details"].append(error_msg)
-                            result["fail_count"] += 1
-                            continue
-
-                        dest_path = os.path.join(full_folder_path, os.path.basename(file_path))
-                        shutil.copy2(file_path, dest_path)
-                        result["success_count"] += 1
-
-                    except Exception as e:
-                        error_msg = f"复制文件失败：{str(e)}"
-                        result["fail_details"].append(error_msg)
-                        result["fail_count"] += 1
+                row_targets.append((row_idx, os.path.join(output_dir, *folder_parts)))
 
             except Exception as e:
                 error_msg = f"处理第 {row_idx+1} 行数据失败：{str(e)}"
                 result["fail_details"].append(error_msg)
                 result["fail_count"] += len(selected_files)
 
+    # 创建文件夹
+    row_label = "个名称" if data_source == 'name' else "行数据"
+    dir_errors = make_dirs_once(path for _, path in row_targets)
+    copy_jobs = []
+    for row_idx, full_folder_path in row_targets:
+        if full_folder_path in dir_errors:
+            error_msg = f"处理第 {row_idx+1} {row_label}失败：{str(dir_errors[full_folder_path])}"
+            result["fail_details"].append(error_msg)
+            result["fail_count"] += len(selected_files)
+            continue
+        result["folder_count"] += 1
+        for file_info in selected_files:
+            dest_path = os.path.join(full_folder_path, file_info["name"])
+            copy_jobs.append((file_info, dest_path))
+
+    # 复制文件
+    run_copy_jobs(_copy_one, copy_jobs, result, copy_mode)
     return result
 
 # API路由
@@ -287,10 +330,11 @@ def index():
 
 @app.route('/select-source-folder', methods=['POST'])
 def select_source_folder():
-    global source_folder, selected_files
+    global source_folder, selected_files, source_file_sizes
     source_folder = select_folder_dialog()
     if source_folder:
         files = get_files_in_folder(source_folder)
+        source_file_sizes = {f["path"]: f["size_bytes"] for f in files}
         selected_files = []
         return jsonify({
             "status": "success",
@@ -303,7 +347,16 @@ def select_source_folder():
 def select_files():
     global selected_files
     data = request.json
-    selected_files = data.get('files', [])
+    selected_files = []
+    for file_path in data.get('files', []):
+        # 优先复用列出文件夹时已获取的大小，不在列表中的文件才单独 stat 一次
+        file_size = source_file_sizes.get(file_path)
+        if file_size is None:
+            try:
+                file_size = os.path.getsize(file_path)
+            except OSError:
+                file_size = 0
+        selected_files.append({"name": os.path.basename(file_path), "path": file_path, "size_bytes": file_size})
     return jsonify({"status": "success", "count": len(selected_files)})
 
 @app.route('/select-name-file', methods=['POST'])
@@ -365,11 +418,7 @@ def set_output_folder():
     if use_default:
         output_folder = os.path.join(get_default_output_folder(), main_folder_name)
     else:
-        root = tk.Tk()
-        root.withdraw()
-        root.attributes('-topmost', True)
-        selected_dir = filedialog.askdirectory(title="选择输出位置")
-        root.destroy()
+        selected_dir = select_folder_dialog(title="选择输出位置")
         
         if not selected_dir:
             output_folder = os.path.join(get_default_output_folder(), main_folder_name)
@@ -394,6 +443,9 @@ def process():
         return jsonify({"status": "error", "message": "未获取到Excel数据或数据为空"})
     if not folder_levels:
         return jsonify({"status": "error", "message": "未设置文件夹层级"})
+    copy_mode = (request.get_json(silent=True) or {}).get('copyMode', 'copy')
+    if copy_mode not in COPY_MODES:
+        return jsonify({"status": "error", "message": f"无效的复制方式：{copy_mode}"})
     if not output_folder:
         output_folder = os.path.join(get_default_output_folder(), 'batch_output')
         os.makedirs(output_folder, exist_ok=True)
@@ -405,7 +457,8 @@ def process():
         excel_data, 
         folder_levels, 
         data_source, 
-        output_folder
+        output_folder,
+        copy_mode
     )
     return jsonify({
         "status": "completed",
@@ -417,4 +470,7 @@ def process():
 if __name__ == '__main__':
     if not os.path.exists('templates'):
         os.makedirs('templates')
-    app.run(host='127.0.0.1', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
+    try:
+        app.run(host='127.0.0.1', port=5000, debug=True, use_reloader=False)
+    finally:
+        _close_tk_root()
\ No newline at end of file
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件复制工具函数（app.py 云端版与 app2.py 本地版共用）
+目录创建、并发复制、硬链接 / reflink 克隆及内核态复制
+"""
+
+import os
+import errno
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 复制线程池大小（I/O 密集，线程数可远多于 CPU 核数）
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# 每个线程池任务批量处理的复制数，减少逐个提交 Future 的调度开销
+COPY_BATCH_SIZE = 64
+_COPY_SOURCES_LOCK = threading.Lock()
+
+# 不超过该大小的源文件整体读入内存，后续每个目标直接写出，不再重复读盘；
+# 更大的文件（单个文件上限 10MB）走 copy_file_range / sendfile 在内核中复制
+COPY_MEMORY_CACHE_LIMIT = 1024 * 1024
+
+# 复制方式：copy 独立副本（默认）；hardlink 硬链接，与源文件共享同一份数据，修改任一处都会影响全部；
+# reflink 写时复制克隆（Btrfs/XFS 等支持时不占额外空间，各副本可独立修改）
+COPY_MODES = ('copy', 'hardlink', 'reflink')
+_FICLONE = 0x40049409  # Linux ioctl：在目标 fd 上克隆源 fd 的全部数据
+
+# copy_file_range / sendfile 不可用时退回普通读写的错误码
+_COPY_FALLBACK_ERRNOS = {
+    errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTSOCK,
+    errno.EOPNOTSUPP, getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP),
+}
+
+# 普通读写时使用的缓冲区（1 MiB，每个复制线程一块，反复复用）
+COPY_BUFFER_SIZE = 1 << 20
+_copy_buffers = threading.local()
+
+def _get_copy_buffer():
+    """取当前线程的复制缓冲区，首次使用时分配"""
+    buf = getattr(_copy_buffers, 'buf', None)
+    if buf is None:
+        buf = _copy_buffers.buf = bytearray(COPY_BUFFER_SIZE)
+    return buf
+
+def _copy_fd_range(src_fd, dst_fd, src_path, size):
+    """在内核态复制文件内容：copy_file_range → sendfile → 普通读写"""
+    offset = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < size:
+                sent = os.copy_file_range(src_fd, dst_fd, size - offset, offset_src=offset)
+                if not sent:
+                    break
+                offset += sent
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    if hasattr(os, 'sendfile'):
+        try:
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if not sent:
+                    break
+                offset += sent
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    buf = _get_copy_buffer()
+    view = memoryview(buf)
+    with open(src_path, 'rb', buffering=0) as fsrc:
+        fsrc.seek(offset)
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            while chunk:
+                chunk = chunk[os.write(dst_fd, chunk):]
+
+def _try_hardlink(src_path, dst_path):
+    """为源文件创建硬链接，文件系统不支持（跨分区、FAT 等）时返回 False"""
+    try:
+        try:
+            os.link(src_path, dst_path)
+        except FileExistsError:
+            if os.path.samefile(src_path, dst_path):
+                # 已是源文件的硬链接（上次生成），无需重建；目标就是源文件本身时交给复制流程报错
+                return os.path.realpath(src_path) != os.path.realpath(dst_path)
+            os.unlink(dst_path)
+            os.link(src_path, dst_path)
+        return True
+    except OSError:
+        return False
+
+def _try_reflink(src_fd, dst_fd):
+    """通过 FICLONE 克隆文件数据，不支持时返回 False"""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+def _open_dst(src_path, dst_path, src_stat):
+    """打开目标文件用于写入；目标与源文件是同一文件时不能截断（否则会清空源文件）"""
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    mode = src_stat.st_mode & 0o777
+    try:
+        return os.open(dst_path, flags | os.O_EXCL, mode)
+    except FileExistsError:
+        pass
+    dst_stat = os.stat(dst_path)
+    if (dst_stat.st_dev, dst_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+        if os.path.realpath(dst_path) == os.path.realpath(src_path):
+            raise shutil.SameFileError(f"{src_path!r} and {dst_path!r} are the same file")
+        # 目标是源文件的硬链接（如上次以 hardlink 方式生成）：删除该链接后写入独立的新文件
+        os.unlink(dst_path)
+        return os.open(dst_path, flags | os.O_EXCL, mode)
+    return os.open(dst_path, flags | os.O_TRUNC, mode)
+
+def fast_copy(src_cache, src_path, dst_path, copy_mode='copy'):
+    """复制文件并保留时间戳；src_cache 缓存源文件的 fd、stat 及小文件内容，同一批次内每个源文件只读取一次；copy_mode 见 COPY_MODES"""
+    if copy_mode == 'hardlink' and _try_hardlink(src_path, dst_path):
+        return
+    cached = src_cache.get(src_path)
+    if cached is None:
+        with _COPY_SOURCES_LOCK:
+            cached = src_cache.get(src_path)
+            if cached is None:
+                src_fd = os.open(src_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                src_stat = os.fstat(src_fd)
+                src_data = None
+                if src_stat.st_size <= COPY_MEMORY_CACHE_LIMIT:
+                    with open(src_fd, 'rb', closefd=False) as fsrc:
+                        src_data = fsrc.read()
+                cached = src_cache[src_path] = (src_fd, src_stat, src_data)
+    src_fd, src_stat, src_data = cached
+    dst_fd = _open_dst(src_path, dst_path, src_stat)
+    try:
+        if copy_mode == 'reflink':
+            # 克隆失败时走 copy_file_range，部分文件系统会在内核中自动转为 reflink
+            if not _try_reflink(src_fd, dst_fd):
+                _copy_fd_range(src_fd, dst_fd, src_path, src_stat.st_size)
+        elif src_data is not None:
+            view = memoryview(src_data)
+            while view:
+                view = view[os.write(dst_fd, view):]
+        else:
+            _copy_fd_range(src_fd, dst_fd, src_path, src_stat.st_size)
+    finally:
+        os.close(dst_fd)
+    os.utime(dst_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+def close_copy_sources(src_cache):
+    """关闭 fast_copy 缓存的源文件 fd"""
+    for src_fd, _, _ in src_cache.values():
+        os.close(src_fd)
+    src_cache.clear()
+
+def run_copy_jobs(copy_one, copy_jobs, result, copy_mode='copy'):
+    """用线程池分批并发执行 (file_info, 目标路径) 复制任务，并把结果汇总到 result；
+    copy_one(src_cache, file_info, 目标路径, copy_mode) 返回 (成功数, 失败数, 失败信息)"""
+    if not copy_jobs:
+        return
+    batches = [copy_jobs[i:i + COPY_BATCH_SIZE] for i in range(0, len(copy_jobs), COPY_BATCH_SIZE)]
+    src_cache = {}
+
+    def copy_batch(batch):
+        return [copy_one(src_cache, file_info, dst, copy_mode) for file_info, dst in batch]
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(COPY_WORKERS, len(batches))) as executor:
+            for outcomes in executor.map(copy_batch, batches):
+                for success, fail, detail in outcomes:
+                    result["success_count"] += success
+                    result["fail_count"] += fail
+                    if detail:
+                        result["fail_details"].append(detail)
+    finally:
+        close_copy_sources(src_cache)
+
+def make_dirs_once(paths):
+    """去重后按字典序（父目录先于子目录）逐个创建目录，返回创建失败的 {路径: 异常}"""
+    created = set()
+    errors = {}
+    for path in sorted(set(paths)):
+        try:
+            if os.path.dirname(path) in created:
+                # 父目录本批次已创建，单次 mkdir 即可，无需 makedirs 逐级检查
+                try:
+                    os.mkdir(path)
+                except FileExistsError:
+                    if not os.path.isdir(path):
+                        raise
+            else:
+                os.makedirs(path, exist_ok=True)
+                created.add(os.path.dirname(path))
+            created.add(path)
+        except OSError as e:
+            errors[path] = e
+    return errors
@@ -7,11 +7,38 @@
 
 
 import os
+import configparser
+import hashlib
+import json
 import sys
 import subprocess
 import platform
+import shutil
+import socket
 import webbrowser
 import time
+from functools import lru_cache
+from pathlib import Path
+
+# Domestic PyPI mirror (Tsinghua), plus backups (Aliyun, USTC) so one mirror outage doesn't fail the install.
+# pip queries every index for every package (no ordering, each backup adds round trips); uv tries them in order
+PYPI_MIRROR = "https://pypi.tuna.tsinghua.edu.cn/simple"
+PYPI_EXTRA_MIRRORS = [
+    "https://mirrors.aliyun.com/pypi/simple/",
+    "https://pypi.mirrors.ustc.edu.cn/simple/",
+]
+REQUIREMENTS_FILE = "requirements_minimal.txt"
+# Optional fully pinned lock file with hashes, installed without dependency resolution. Generate with:
+#   pip-compile --generate-hashes -o requirements_minimal.lock requirements_minimal.txt
+REQUIREMENTS_LOCK_FILE = "requirements_minimal.lock"
+
+# Platform and venv layout never change during a run, so resolve them once
+IS_WINDOWS = platform.system() == 'Windows'
+VENV_PATH = os.path.join(os.getcwd(), 'venv')
+VENV_BIN = os.path.join(VENV_PATH, 'Scripts' if IS_WINDOWS else 'bin')
+VENV_PYTHON = os.path.join(VENV_BIN, 'python.exe' if IS_WINDOWS else 'python')
+VENV_PIP = os.path.join(VENV_BIN, 'pip.exe' if IS_WINDOWS else 'pip')
+_venv_executables = {}  # Executables found in the venv, cached once located
 
 def get_python_executable():
     """Get path of current Python executable"""
@@ -19,24 +46,42 @@ def get_python_executable():
 
 def get_venv_path():
     """Get virtual environment path (isolated, no local env pollution)"""
-    return os.path.join(os.getcwd(), 'venv')
+    return VENV_PATH
+
+def find_venv_executable(*names):
+    """Locate an executable in the venv with shutil.which (any layout/interpreter); None if not present yet"""
+    if names not in _venv_executables:
+        for name in names:
+            path = shutil.which(name, path=VENV_BIN)
+            if path:
+                _venv_executables[names] = path
+                break
+        else:
+            return None
+    return _venv_executables[names]
 
 def is_venv_exists():
     """Check if virtual environment already exists"""
-    venv_path = get_venv_path()
-    if platform.system() == 'Windows':
-        return os.path.exists(os.path.join(venv_path, 'Scripts', 'python.exe'))
-    else:
-        return os.path.exists(os.path.join(venv_path, 'bin', 'python'))
+    return find_venv_executable('python', 'python3') is not None
+
+def get_uv():
+    """Get path of the uv executable if installed (much faster venv creation and installs), else None"""
+    return shutil.which('uv')
 
 def create_venv():
     """Create isolated virtual environment"""
     print("Creating virtual environment (isolated, no local env pollution)...")
     python_exe = get_python_executable()
     venv_path = get_venv_path()
+    uv_exe = get_uv()
     
     try:
-        subprocess.check_call([python_exe, '-m', 'venv', venv_path], 
+        if uv_exe:
+            command = [uv_exe, 'venv', '--python', python_exe, venv_path]
+        else:
+            # Skip ensurepip: dependencies are installed with the launcher's pip (see get_pip_command)
+            command = [python_exe, '-m', 'venv', '--without-pip', venv_path]
+        subprocess.check_call(command,
                               stdout=subprocess.DEVNULL, 
                               stderr=subprocess.STDOUT)
         print("Virtual environment created successfully!")
@@ -47,59 +92,71 @@ def create_venv():
 
 def get_venv_python():
     """Get Python executable path inside virtual environment"""
-    venv_path = get_venv_path()
-    if platform.system() == 'Windows':
-        return os.path.join(venv_path, 'Scripts', 'python.exe')
-    else:
-        return os.path.join(venv_path, 'bin', 'python')
+    return find_venv_executable('python', 'python3') or VENV_PYTHON
 
 def get_venv_pip():
     """Get pip executable path inside virtual environment"""
-    venv_path = get_venv_path()
-    if platform.system() == 'Windows':
-        return os.path.join(venv_path, 'Scripts', 'pip.exe')
-    else:
-        return os.path.join(venv_path, 'bin', 'pip')
+    return find_venv_executable('pip', 'pip3') or VENV_PIP
+
+def get_pip_config_path():
+    """Get pip config file path of the virtual environment (site-level, only affects this venv)"""
+    config_name = 'pip.ini' if IS_WINDOWS else 'pip.conf'
+    return os.path.join(get_venv_path(), config_name)
+
+def get_index_args():
+    """Index options for pip: primary mirror plus backups (pip looks each package up on all of them)"""
+    args = ['--index-url', PYPI_MIRROR]
+    for mirror in PYPI_EXTRA_MIRRORS:
+        args += ['--extra-index-url', mirror]
+    return args
+
+def get_uv_index_args():
+    """Index options for uv: extra indexes take priority over --index-url, so list the primary mirror first among the extras"""
+    *extra_mirrors, default_mirror = [PYPI_MIRROR, *PYPI_EXTRA_MIRRORS]
+    args = []
+    for mirror in extra_mirrors:
+        args += ['--extra-index-url', mirror]
+    return args + ['--index-url', default_mirror]
+
+def get_pip_command():
+    """Get pip command that installs into the virtual environment, bootstrapping pip only when needed"""
+    pip_exe = get_venv_pip()
+    if os.path.exists(pip_exe):
+        return [pip_exe]
+    
+    # The venv has no pip of its own: pip>=22.3 of the launching Python can target it via --python
+    try:
+        from importlib.metadata import version
+        pip_version = tuple(int(v) for v in version('pip').split('.')[:2])
+        if pip_version >= (22, 3):
+            return [get_python_executable(), '-m', 'pip', '--python', get_venv_python()]
+    except Exception:
+        pass
+    
+    print("Bootstrapping pip in virtual environment...")
+    subprocess.check_call([get_venv_python(), '-Im', 'ensurepip', '--default-pip'],
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.STDOUT)
+    return [pip_exe]
 
 def configure_pip_mirror():
     """Configure domestic PyPI mirror for fast installation"""
     print("Configuring domestic PyPI mirror (for fast download)...")
-    pip_exe = get_venv_pip()
-    # Priority domestic mirrors (Tsinghua > Aliyun > USTC)
-    mirrors = [
-        "https://pypi.tuna.tsinghua.edu.cn/simple",
-        "https://mirrors.aliyun.com/pypi/simple/",
-        "https://pypi.mirrors.ustc.edu.cn/simple/"
-    ]
+    # Writing the config file directly avoids spawning `pip config`
+    mirror = PYPI_MIRROR
+    config_path = get_pip_config_path()
     
     try:
-        # Try Tsinghua mirror first
-        result = subprocess.run([pip_exe, 'config', 'set', 'global.index-url', mirrors[0]],
-                              capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            print(f"PyPI mirror configured: {mirrors[0]}")
-            return True
-        else:
-            print(f"Tsinghua mirror failed, trying Aliyun...")
-            result = subprocess.run([pip_exe, 'config', 'set', 'global.index-url', mirrors[1]],
-                                  capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                print(f"PyPI mirror configured: {mirrors[1]}")
-                return True
-            else:
-                print(f"Aliyun mirror failed, trying USTC...")
-                result = subprocess.run([pip_exe, 'config', 'set', 'global.index-url', mirrors[2]],
-                                      capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    print(f"PyPI mirror configured: {mirrors[2]}")
-                    return True
-                else:
-                    print("Domestic mirror config failed, use default PyPI source")
-                    return False
-                    
+        config = configparser.ConfigParser()
+        config.read(config_path, encoding='utf-8')
+        if not config.has_section('global'):
+            config.add_section('global')
+        config.set('global', 'index-url', mirror)
+        os.makedirs(os.path.dirname(config_path), exist_ok=True)
+        with open(config_path, 'w', encoding='utf-8') as f:
+            config.write(f)
+        print(f"PyPI mirror configured: {mirror}")
+        return True
     except Exception as e:
         print(f"Error configuring PyPI mirror: {str(e)}")
         return False
@@ -107,50 +164,53 @@ def configure_pip_mirror():
 def install_dependencies():
     """Install dependencies from requirements_minimal.txt (fallback to basic deps if file missing)"""
     print("Installing dependencies (from requirements_minimal.txt)...")
-    pip_exe = get_venv_pip()
-    req_file = "requirements_minimal.txt"
-    requirements = []
-    
-    # Step 1: Read requirements from file
-    try:
-        with open(req_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                # Skip comments, empty lines
-                if not line or line.startswith('#'):
-                    continue
-                requirements.append(line)
-        
-        if requirements:
-            print(f"Loaded {len(requirements)} dependencies from {req_file}")
-        else:
-            print(f"No valid dependencies in {req_file}, use fallback list")
-            requirements = ['flask>=2.0.0', 'flask-cors>=3.0.0']
+    req_file = REQUIREMENTS_FILE
     
+    # Step 1: Hand the requirements file straight to the installer so it resolves everything in one pass
+    if os.path.isfile(REQUIREMENTS_LOCK_FILE):
+        # Every package is already pinned with hashes: skip the resolver's metadata round trips
+        print(f"Installing pinned dependencies from {REQUIREMENTS_LOCK_FILE}")
+        requirements = ['--no-deps', '--require-hashes', '-r', REQUIREMENTS_LOCK_FILE]
+    elif os.path.isfile(req_file):
+        print(f"Installing dependencies listed in {req_file}")
+        requirements = ['-r', req_file]
     # Handle file not found: use fallback dependencies
-    except FileNotFoundError:
+    else:
         print(f"{req_file} not found, use fallback dependencies")
         requirements = ['flask>=2.0.0', 'flask-cors>=3.0.0']
-    except Exception as e:
-        print(f"Error reading {req_file}: {str(e)}, use fallback dependencies")
-        requirements = ['flask>=2.0.0', 'flask-cors>=3.0.0']
     
-    # Step 2: Upgrade pip first
+    # uv resolves and downloads in parallel with a shared cache, and needs no pip inside the venv
+    uv_exe = get_uv()
+    if uv_exe:
+        try:
+            print("Installing dependencies with uv (with domestic mirror)...")
+            subprocess.check_call([
+                uv_exe, 'pip', 'install',
+                '--python', get_venv_python(),
+                *get_uv_index_args(),  # Force domestic mirrors, Tsinghua first
+                *requirements
+            ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            
+            print("All dependencies installed successfully!")
+            return True
+        except Exception as e:
+            print(f"uv install failed: {str(e)} (fall back to pip)")
+    
+    # The venv is created without pip
     try:
-        print("Upgrading pip...")
-        subprocess.check_call([pip_exe, 'install', '--upgrade', 'pip'],
-                              stdout=subprocess.DEVNULL, 
-                              stderr=subprocess.STDOUT)
+        pip_command = get_pip_command()
     except Exception as e:
-        print(f"pip upgrade warning: {str(e)} (continue installing dependencies)")
+        print(f"Error bootstrapping pip: {str(e)}")
+        return False
     
-    # Step 3: Install dependencies with domestic mirror
+    # Step 2: Install dependencies with domestic mirror (the pip bundled with the venv is recent enough)
     try:
         print("Installing dependencies (with domestic mirror)...")
         subprocess.check_call([
-            pip_exe, 'install',
-            '-i', 'https://pypi.tuna.tsinghua.edu.cn/simple',  # Force domestic mirror
+            *pip_command, 'install',
+            *get_index_args(),  # Force domestic mirrors
             '--no-cache-dir',  # Avoid cache issues
+            '--prefer-binary',  # Prefer wheels over building sdists
             *requirements
         ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
         
@@ -163,8 +223,106 @@ def install_dependencies():
         print(f"Error installing dependencies: {str(e)}")
         return False
 
-def start_application():
-    """Start Flask application and open browser"""
+def get_profile_path():
+    """Get path of the setup profile recorded after a successful install"""
+    return os.path.join(get_venv_path(), '.setup_profile.json')
+
+def build_setup_profile():
+    """Describe the current setup: Python version, requirements hash and mirror"""
+    req_hash = hashlib.sha256()
+    for req_file in (REQUIREMENTS_FILE, REQUIREMENTS_LOCK_FILE):
+        try:
+            req_hash.update(Path(req_file).read_bytes())
+        except OSError:
+            pass
+        req_hash.update(b'\0')
+    return {
+        "py": f"{sys.version_info.major}.{sys.version_info.minor}",
+        "req_hash": req_hash.hexdigest(),
+        "mirror": [PYPI_MIRROR, *PYPI_EXTRA_MIRRORS],
+    }
+
+def is_setup_up_to_date():
+    """Check whether the saved profile matches the current setup (deps already installed)"""
+    try:
+        with open(get_profile_path(), 'r', encoding='utf-8') as f:
+            return json.load(f) == build_setup_profile()
+    except (OSError, ValueError):
+        return False
+
+def save_setup_profile():
+    """Record the current setup so later runs can skip mirror config and install"""
+    try:
+        with open(get_profile_path(), 'w', encoding='utf-8') as f:
+            json.dump(build_setup_profile(), f)
+    except OSError as e:
+        print(f"Warning: failed to save setup profile: {str(e)}")
+
+def wait_for_server(process, host='127.0.0.1', port=5000, timeout=10, interval=0.05):
+    """Poll until the server accepts TCP connections; return False if the process exits or time runs out"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection((host, port), timeout=0.1):
+                return True
+        except OSError:
+            time.sleep(interval)
+    return False
+
+@lru_cache(maxsize=1)
+def get_browser_command():
+    """Get the OS command that opens a URL in the default browser (None on Windows or if missing)"""
+    if IS_WINDOWS:
+        return None  # os.startfile is used instead
+    if sys.platform == 'darwin':
+        return ['open']
+    xdg_open = shutil.which('xdg-open')
+    return [xdg_open] if xdg_open else None
+
+def open_browser(url):
+    """Open URL via the OS launcher directly, falling back to webbrowser's handler chain"""
+    try:
+        if IS_WINDOWS:
+            os.startfile(url)
+            return
+        command = get_browser_command()
+        if command:
+            subprocess.Popen([*command, url],
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL,
+                             close_fds=False)
+            return
+    except OSError:
+        pass
+    webbrowser.open(url)
+
+def open_browser_when_ready(timeout=30):
+    """Fork a detached helper that opens the browser once the server is listening (POSIX only)"""
+    pid = os.fork()
+    if pid:
+        # The intermediate child exits at once; the grandchild is reparented and never becomes a zombie
+        os.waitpid(pid, 0)
+        return
+    try:
+        if os.fork() == 0 and wait_for_server(None, timeout=timeout):
+            open_browser('http://127.0.0.1:5000')
+    finally:
+        os._exit(0)
+
+def venv_has_module(name):
+    """Check whether the venv's Python can find a module (without importing it)"""
+    check = f"import importlib.util, sys; sys.exit(importlib.util.find_spec({name!r}) is None)"
+    try:
+        return subprocess.call([get_venv_python(), '-c', check],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL) == 0
+    except OSError:
+        return False
+
+def start_application(replace_process=True):
+    """Start Flask application and open browser (replace_process=False keeps the supervised start)"""
     print("Starting application...")
     python_exe = get_venv_python()
     app_file = "app.py"
@@ -175,35 +333,42 @@ def start_application():
         return False
     
     try:
-        # Start Flask app in background
-        process = subprocess.Popen([python_exe, app_file],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
-                                  text=True)
+        # Only exec when the app can actually start: a failed exec'd app would leave
+        # no launcher behind to report it, so incomplete installs keep the Popen path
+        if os.name == 'posix' and replace_process and venv_has_module('flask'):
+            # Replace this script with the app itself: no extra supervising process,
+            # and Ctrl+C / app output go straight to the Flask server
+            print("Access URL: http://127.0.0.1:5000 (browser opens when the server is ready)")
+            print("Press Ctrl+C to stop the application")
+            sys.stdout.flush()
+            open_browser_when_ready()
+            os.execv(python_exe, [python_exe, app_file])
         
-        # Wait for server to start (3 seconds)
-        print("Waiting for server to start...")
-        time.sleep(3)
+        # Start Flask app in background; its output goes straight to this console
+        # (undrained pipes would fill up and block the app on print).
+        # close_fds=False: the launcher holds no descriptors worth hiding, so skip closing them one by one
+        process = subprocess.Popen([python_exe, app_file], close_fds=False)
         
-        # Check if process is still running
-        if process.poll() is not None:
-            stdout, stderr = process.communicate()
-            print(f"App startup failed (stdout): {stdout}")
-            print(f"App startup failed (stderr): {stderr}")
-            return False
+        # Wait until the server is accepting connections (up to 10 seconds)
+        print("Waiting for server to start...")
+        if not wait_for_server(process):
+            # Check if process is still running
+            if process.poll() is not None:
+                print(f"App startup failed (exit code {process.returncode}), see output above")
+                return False
+            print("Server not responding yet, opening browser anyway...")
         
         # Open browser automatically
         print("Opening browser (http://127.0.0.1:5000)...")
-        webbrowser.open('http://127.0.0.1:5000')
+        open_browser('http://127.0.0.1:5000')
         
         print("Application started successfully!")
         print("Access URL: http://127.0.0.1:5000")
         print("Press Ctrl+C to stop the application")
         
-        # Keep script running
+        # Keep script running until the app exits (blocks without polling)
         try:
-            while True:
-                time.sleep(1)
+            process.wait()
         except KeyboardInterrupt:
             print("\nStopping application...")
             process.terminate()
@@ -215,6 +380,18 @@ def start_application():
         print(f"Error starting application: {str(e)}")
         return False
 
+def show_error(message):
+    """Show an error dialog for users who launched by double-click (tkinter imported only on failure)"""
+    try:
+        from tkinter import Tk, messagebox
+        root = Tk()
+        root.withdraw()
+        messagebox.showerror("Error", message)
+        root.destroy()
+    except Exception:
+        # No tkinter or no display: the console message is all we can show
+        pass
+
 def main():
     """Main workflow"""
     print("=" * 60)
@@ -236,33 +413,48 @@ def main():
         print("Virtual environment not found, creating...")
         if not create_venv():
             print("Failed to create virtual environment, exit")
+            show_error("Failed to create virtual environment")
             sys.exit(1)
     else:
         print("Virtual environment already exists")
     
-    # Step 2: Configure PyPI mirror
-    configure_pip_mirror()
-    
-    # Step 3: Install dependencies
-    if not install_dependencies():
-        print("Dependency install failed, continue? (y/n)")
-        choice = input().strip().lower()
-        if choice != 'y':
-            sys.exit(1)
+    # Steps 2-3 are skipped when dependencies were already installed for the same requirements
+    installed = True
+    if is_setup_up_to_date():
+        print("Dependencies up to date, skip mirror config and install")
+    else:
+        # Step 2: Configure PyPI mirror
+        configure_pip_mirror()
+        
+        # Step 3: Install dependencies
+        installed = install_dependencies()
+        if installed:
+            save_setup_profile()
+        else:
+            print("Dependency install failed, continue? (y/n)")
+            choice = input().strip().lower()
+            if choice != 'y':
+                sys.exit(1)
     
     # Step 4: Start application
-    if not start_application():
+    if not start_application(replace_process=installed):
         print("Application startup failed")
+        show_error("Application startup failed")
         sys.exit(1)
     
     print("\nSetup completed successfully")
 
-if __name__ == "__main__":
+def run():
+    """Launcher entry point: run main() and keep the console window open afterwards"""
     try:
         main()
     except KeyboardInterrupt:
         print("\nScript interrupted by user")
     except Exception as e:
         print(f"\nScript error: {str(e)}")
+        show_error(f"Script error: {str(e)}")
     finally:
-        input("\nPress Enter to exit...")
\ No newline at end of file
+        input("\nPress Enter to exit...")
+
+if __name__ == "__main__":
+    run()
\ No newline at end of file